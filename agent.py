@@ -6,6 +6,8 @@ Uses Claude Sonnet with tool use and full Stormline business context.
 import logging
 import json
 import asyncio
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 import anthropic
 from config import config
@@ -142,39 +144,58 @@ Key paths:
 - Stormline ops platform: /home/corey_tigert/.openclaw/workspace/stormline-ops/
 """
 
+# System prompt as a cacheable block: tools + system are identical on every
+# call, so Anthropic's prompt cache serves them instead of re-prefilling
+SYSTEM_BLOCKS = [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+
+# Agent runs block a thread for the whole tool loop; keep them off the default
+# executor so they can't starve short to_thread work like image downscaling
+_AGENT_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="agent")
+
+# Users whose history is kept; the least recently active is dropped beyond this
+MAX_HISTORY_USERS = 10000
+
 
 class StormlineAgent:
     def __init__(self):
         self.client = anthropic.Anthropic(api_key=config.anthropic_api_key)
         self.model = "claude-sonnet-4-6"
-        self.histories: dict[int, list] = {}
+        # Bounded deques keep the last N exchanges, evicting the oldest in O(1);
+        # the OrderedDict is kept in least-recently-active-first order
+        self.histories: OrderedDict[int, deque] = OrderedDict()
 
-    def _get_history(self, user_id: int) -> list:
-        return self.histories.get(user_id, [])
+    def _get_history(self, user_id: int) -> deque:
+        return self.histories.get(user_id, deque())
 
     def _add_to_history(self, user_id: int, role: str, content):
-        if user_id not in self.histories:
-            self.histories[user_id] = []
-        self.histories[user_id].append({"role": role, "content": content})
-        # Keep last N exchanges
-        max_msgs = config.max_history_length * 2
-        if len(self.histories[user_id]) > max_msgs:
-            self.histories[user_id] = self.histories[user_id][-max_msgs:]
+        history = self.histories.get(user_id)
+        if history is None:
+            history = self.histories[user_id] = deque(maxlen=config.max_history_length * 2)
+            if len(self.histories) > MAX_HISTORY_USERS:
+                self.histories.popitem(last=False)
+        else:
+            self.histories.move_to_end(user_id)
+        history.append({"role": role, "content": content})
 
     def clear_history(self, user_id: int):
         self.histories.pop(user_id, None)
 
+    async def warm_up(self):
+        """Open the API connection (DNS, TLS, auth) before the first user message."""
+        try:
+            await asyncio.to_thread(self.client.models.list, limit=1)
+            logger.info("Anthropic connection warmed up")
+        except Exception as e:
+            logger.warning(f"Warm-up request failed, continuing: {e}")
+
     async def respond(self, user_id: int, message: str) -> str:
         """Send a message and get a response, handling tool calls."""
         self._add_to_history(user_id, "user", message)
         history = self._get_history(user_id)
 
-        loop = asyncio.get_event_loop()
-
         try:
-            response_text = await loop.run_in_executor(
-                None, lambda: self._run_agent(history)
-            )
+            loop = asyncio.get_running_loop()
+            response_text = await loop.run_in_executor(_AGENT_EXECUTOR, self._run_agent, history)
             self._add_to_history(user_id, "assistant", response_text)
             return response_text
         except Exception as e:
@@ -190,7 +211,7 @@ class StormlineAgent:
             response = self.client.messages.create(
                 model=self.model,
                 max_tokens=4096,
-                system=SYSTEM_PROMPT,
+                system=SYSTEM_BLOCKS,
                 tools=TOOL_DEFINITIONS,
                 messages=working_messages,
             )
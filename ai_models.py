@@ -4,37 +4,271 @@ Handles interactions with Anthropic Claude and OpenAI GPT-4 APIs.
 """
 
 import logging
+import asyncio
 import base64
-from typing import Optional, List, Dict
+import difflib
+import hashlib
+import io
+import json
+import time
+from collections import OrderedDict
+from typing import Optional, List, Dict, Awaitable, Callable
 import anthropic
+import httpx
 import openai
 from config import config
-from utils import retry_with_backoff, truncate_text
+from utils import retry_with_backoff, truncate_text, current_idempotency_key, NonRetryableError
 
 logger = logging.getLogger(__name__)
 
+# One keep-alive connection pool shared by every async SDK client, so TLS
+# handshakes to the provider endpoints are paid once rather than per client
+shared_http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_keepalive_connections=50,
+        max_connections=100,
+        keepalive_expiry=300
+    ),
+    http2=True,
+    timeout=httpx.Timeout(60.0, connect=10.0)
+)
+
+
+# Cap in-flight requests per provider so bursts queue locally instead of
+# tripping rate limits and amplifying into retry storms
+MAX_CONCURRENT_REQUESTS = 8
+_claude_sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+_gpt_sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+
+# Claude vision resizes anything larger on its side; sending more pixels only adds upload time
+MAX_IMAGE_EDGE = 1568
+
+
+def _downscale_image(image_data: bytes, max_edge: int = MAX_IMAGE_EDGE) -> bytes:
+    """
+    Shrink an image so its longest side is at most max_edge pixels.
+    
+    Args:
+        image_data: Encoded image bytes
+        max_edge: Maximum width or height in pixels
+        
+    Returns:
+        Re-encoded bytes if the image was resized (PNG stays PNG, anything
+        else becomes JPEG), otherwise the input unchanged
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return image_data
+    
+    try:
+        with Image.open(io.BytesIO(image_data)) as img:
+            if max(img.size) <= max_edge:
+                return image_data
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            buf = io.BytesIO()
+            if img.format == "PNG":
+                # Keep rendered plan sheets lossless; line art compresses well as PNG
+                img.save(buf, format="PNG")
+            else:
+                img.convert("RGB").save(buf, format="JPEG", quality=85)
+    except (OSError, Image.DecompressionBombError) as e:
+        # Bytes that pass the magic-number check can still fail to decode;
+        # send the original and let the API judge it
+        logger.debug("Could not downscale image, sending original: %s", e)
+        return image_data
+    
+    logger.debug("Downscaled image from %s to %s bytes", len(image_data), buf.tell())
+    return buf.getvalue()
+
+
+def _idempotency_headers() -> Optional[Dict[str, str]]:
+    """
+    Build request headers that make retried calls safe to replay.
+    
+    Returns:
+        Idempotency-Key header for the current retried call, if any
+    """
+    key = current_idempotency_key()
+    return {"Idempotency-Key": key} if key else None
+
+
+async def close_shared_http_client():
+    """Close the shared HTTP connection pool on shutdown."""
+    await shared_http_client.aclose()
+    logger.info("Shared HTTP client closed")
+
+
+class LLMCache:
+    """Bounded LRU cache of model responses keyed on (model, messages)."""
+    
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600.0):
+        """
+        Initialize response cache.
+        
+        Args:
+            max_entries: Maximum number of cached responses
+            ttl: Seconds before a cached response expires
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+    
+    @staticmethod
+    def make_key(model: str, messages: List[Dict]) -> str:
+        """
+        Build a cache key for a model request.
+        
+        Args:
+            model: Model name
+            messages: Full messages list sent to the model
+            
+        Returns:
+            Hex digest identifying the request
+        """
+        payload = json.dumps(
+            {"model": model, "messages": messages},
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached response.
+        
+        Args:
+            key: Cache key from make_key
+            
+        Returns:
+            Cached response, or None on miss or expiry
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        
+        stored_at, response = entry
+        if time.monotonic() - stored_at > self.ttl:
+            self._entries.pop(key, None)
+            return None
+        
+        self._entries.move_to_end(key)
+        return response
+    
+    def set(self, key: str, response: str):
+        """
+        Store a response, evicting the least recently used entries.
+        
+        Args:
+            key: Cache key from make_key
+            response: Response text to cache
+        """
+        self._entries[key] = (time.monotonic(), response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[str]]
+    ) -> str:
+        """
+        Return a cached response, computing it at most once per key.
+        
+        Concurrent callers that miss the cache for the same key share a
+        single in-flight request instead of each hitting the API. The
+        request runs in its own task, so a caller that is cancelled only
+        stops waiting; the request is cancelled once no caller is left.
+        
+        Args:
+            key: Cache key from make_key
+            compute: Coroutine factory that produces the response
+            
+        Returns:
+            Cached, shared, or freshly computed response
+        """
+        cached = self.get(key)
+        if cached is not None:
+            logger.debug("Response served from cache")
+            return cached
+        
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._compute_and_store(key, compute))
+            self._inflight[key] = task
+        else:
+            logger.debug("Joining in-flight request for identical prompt")
+        
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    # Unregister now, not when the task unwinds, so a caller
+                    # arriving in between starts afresh instead of joining it
+                    if self._inflight.get(key) is task:
+                        del self._inflight[key]
+                    task.cancel()
+    
+    async def _compute_and_store(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[str]]
+    ) -> str:
+        """
+        Run a shared request and cache its response.
+        
+        Args:
+            key: Cache key from make_key
+            compute: Coroutine factory that produces the response
+            
+        Returns:
+            Freshly computed response
+        """
+        try:
+            result = await compute()
+            self.set(key, result)
+            return result
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+
+llm_cache = LLMCache()
+
 
 class ClaudeModel:
     """Wrapper for Anthropic Claude API."""
     
     def __init__(self):
         """Initialize Claude client."""
-        self.client = anthropic.Anthropic(api_key=config.anthropic_api_key)
+        self.client = anthropic.AsyncAnthropic(
+            api_key=config.anthropic_api_key,
+            http_client=shared_http_client
+        )
         self.model = "claude-3-haiku-20240307"
+        self._sem = _claude_sem
         logger.info("Claude model initialized")
     
     @retry_with_backoff(max_retries=3, base_delay=1.0)
     async def generate_response(
         self,
-        message: str,
-        conversation_history: Optional[List[Dict]] = None
+        messages: List[Dict],
+        no_cache: bool = False
     ) -> str:
         """
         Generate response from Claude.
         
         Args:
-            message: User message
-            conversation_history: Optional conversation history
+            messages: Conversation history followed by the current user message
+            no_cache: Skip the response cache for this call
             
         Returns:
             Claude's response
@@ -43,55 +277,86 @@ class ClaudeModel:
             Exception: If API call fails after retries
         """
         try:
-            # Build messages list
-            messages = []
-            
-            if conversation_history:
-                # Add conversation history
-                messages.extend(conversation_history)
-            
-            # Add current message
-            messages.append({
-                "role": "user",
-                "content": message
-            })
-            
-            logger.debug(f"Sending request to Claude with {len(messages)} messages")
-            
-            # Call Claude API in thread pool to avoid blocking event loop
-            import asyncio
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.client.messages.create(
-                    model=self.model,
-                    max_tokens=4096,
-                    messages=messages
-                )
+            if no_cache:
+                return await self._request(messages)
+            return await llm_cache.get_or_compute(
+                llm_cache.make_key(self.model, messages),
+                lambda: self._request(messages)
             )
             
-            # Extract text from response
-            result = response.content[0].text
-            logger.info(f"Received response from Claude ({len(result)} chars)")
-            
-            return truncate_text(result, config.max_message_length)
-            
         except anthropic.RateLimitError as e:
-            logger.error(f"Claude rate limit exceeded: {e}")
-            raise Exception("Rate limit exceeded. Please try again later.")
+            logger.error("Claude rate limit exceeded: %s", e)
+            raise Exception("Rate limit exceeded. Please try again later.") from e
         except anthropic.APIError as e:
-            logger.error(f"Claude API error: {e}")
-            raise Exception(f"Claude API error: {str(e)}")
+            logger.error("Claude API error: %s", e)
+            raise Exception(f"Claude API error: {str(e)}") from e
         except Exception as e:
-            logger.error(f"Unexpected error calling Claude: {e}")
+            logger.error("Unexpected error calling Claude: %s", e)
             raise
     
+    async def _request(self, messages: List[Dict]) -> str:
+        """
+        Send a single uncached request to Claude.
+        
+        Args:
+            messages: Conversation history followed by the current user message
+            
+        Returns:
+            Claude's response, truncated to the Telegram message limit
+        """
+        logger.debug("Sending request to Claude with %s messages", len(messages))
+        
+        # Call Claude API
+        async with self._sem:
+            response = await self.client.messages.create(
+                model=self.model,
+                max_tokens=4096,
+                messages=self._with_cache_breakpoint(messages),
+                extra_headers=_idempotency_headers()
+            )
+        
+        # Extract text from response
+        result = response.content[0].text
+        logger.info("Received response from Claude (%s chars)", len(result))
+        
+        return truncate_text(result, config.max_message_length)
+    
+    @staticmethod
+    def _with_cache_breakpoint(messages: List[Dict]) -> List[Dict]:
+        """
+        Mark the end of the conversation history as a prompt-cache breakpoint.
+        
+        History is append-only, so everything up to the previous turn is
+        byte-identical to the last request and can be served from
+        Anthropic's prompt cache instead of being prefilled again.
+        
+        Args:
+            messages: Conversation history followed by the current user message
+            
+        Returns:
+            Messages list with the last history turn as a cached text block
+        """
+        if len(messages) < 2 or not isinstance(messages[-2].get("content"), str):
+            return messages
+        
+        last_turn = messages[-2]
+        cached_turn = {
+            "role": last_turn["role"],
+            "content": [{
+                "type": "text",
+                "text": last_turn["content"],
+                "cache_control": {"type": "ephemeral"}
+            }]
+        }
+        return messages[:-2] + [cached_turn, messages[-1]]
+    
     @retry_with_backoff(max_retries=3, base_delay=1.0)
     async def analyze_image(
         self,
         image_data: bytes,
         prompt: str,
-        conversation_history: Optional[List[Dict]] = None
+        conversation_history: Optional[List[Dict]] = None,
+        no_cache: bool = False
     ) -> str:
         """
         Analyze an image using Claude's vision capabilities.
@@ -100,6 +365,7 @@ class ClaudeModel:
             image_data: Image bytes
             prompt: Analysis prompt
             conversation_history: Optional conversation history
+            no_cache: Skip the response cache for this call
             
         Returns:
             Claude's analysis
@@ -111,74 +377,119 @@ class ClaudeModel:
             # Validate image size (20MB limit)
             max_size = 20 * 1024 * 1024  # 20MB
             if len(image_data) > max_size:
-                raise Exception(f"Image size ({len(image_data)} bytes) exceeds maximum allowed size (20MB)")
+                raise NonRetryableError(f"Image size ({len(image_data)} bytes) exceeds maximum allowed size (20MB)")
             
             # Detect image format
             image_format = self._detect_image_format(image_data)
             if image_format not in ['image/jpeg', 'image/png', 'image/gif', 'image/webp']:
-                raise Exception(f"Unsupported image format. Please use JPEG, PNG, GIF, or WebP.")
-            
-            # Encode image to base64
-            image_base64 = base64.standard_b64encode(image_data).decode('utf-8')
-            
-            logger.debug(f"Analyzing image with format {image_format}, size {len(image_data)} bytes")
-            
-            # Build messages list
-            messages = []
-            
-            if conversation_history:
-                # Add conversation history (text only)
-                messages.extend(conversation_history)
-            
-            # Add current message with image
-            messages.append({
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": image_format,
-                            "data": image_base64
-                        }
-                    },
-                    {
-                        "type": "text",
-                        "text": prompt
-                    }
-                ]
-            })
-            
-            logger.debug(f"Sending vision request to Claude with {len(messages)} messages")
-            
-            # Call Claude Vision API in thread pool to avoid blocking event loop
-            import asyncio
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.client.messages.create(
-                    model=self.model,
-                    max_tokens=4096,
-                    messages=messages
-                )
-            )
+                raise NonRetryableError(f"Unsupported image format. Please use JPEG, PNG, GIF, or WebP.")
             
-            # Extract text from response
-            result = response.content[0].text
-            logger.info(f"Received vision analysis from Claude ({len(result)} chars)")
+            if no_cache:
+                return await self._analyze_request(
+                    image_data, image_format, prompt, conversation_history
+                )
             
-            return truncate_text(result, config.max_message_length)
+            # Key on a digest of the original bytes so a hit skips resizing and upload
+            image_digest = hashlib.blake2b(image_data, digest_size=16).hexdigest()
+            cache_key = llm_cache.make_key(
+                self.model,
+                list(conversation_history or []) + [{
+                    "role": "user",
+                    "content": [
+                        {"type": "image", "digest": image_digest},
+                        {"type": "text", "text": prompt}
+                    ]
+                }]
+            )
+            return await llm_cache.get_or_compute(
+                cache_key,
+                lambda: self._analyze_request(
+                    image_data, image_format, prompt, conversation_history
+                )
+            )
             
         except anthropic.RateLimitError as e:
-            logger.error(f"Claude rate limit exceeded: {e}")
-            raise Exception("Rate limit exceeded. Please try again later.")
+            logger.error("Claude rate limit exceeded: %s", e)
+            raise Exception("Rate limit exceeded. Please try again later.") from e
         except anthropic.APIError as e:
-            logger.error(f"Claude API error: {e}")
-            raise Exception(f"Claude API error: {str(e)}")
+            logger.error("Claude API error: %s", e)
+            raise Exception(f"Claude API error: {str(e)}") from e
         except Exception as e:
-            logger.error(f"Unexpected error in vision analysis: {e}")
+            logger.error("Unexpected error in vision analysis: %s", e)
             raise
     
+    async def _analyze_request(
+        self,
+        image_data: bytes,
+        image_format: str,
+        prompt: str,
+        conversation_history: Optional[List[Dict]]
+    ) -> str:
+        """
+        Send a single uncached vision request to Claude.
+        
+        Args:
+            image_data: Validated image bytes
+            image_format: MIME type of image_data
+            prompt: Analysis prompt
+            conversation_history: Optional conversation history
+            
+        Returns:
+            Claude's analysis, truncated to the Telegram message limit
+        """
+        # Re-encoding would drop GIF animation frames
+        if image_format != 'image/gif':
+            image_data = await asyncio.to_thread(_downscale_image, image_data)
+            image_format = self._detect_image_format(image_data)
+        
+        # Encode image to base64
+        image_base64 = base64.standard_b64encode(image_data).decode('utf-8')
+        
+        logger.debug("Analyzing image with format %s, size %s bytes", image_format, len(image_data))
+        
+        # Build messages list
+        messages = []
+        
+        if conversation_history:
+            # Add conversation history (text only)
+            messages.extend(conversation_history)
+        
+        # Add current message with image
+        messages.append({
+            "role": "user",
+            "content": [
+                {
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": image_format,
+                        "data": image_base64
+                    }
+                },
+                {
+                    "type": "text",
+                    "text": prompt
+                }
+            ]
+        })
+        
+        logger.debug("Sending vision request to Claude with %s messages", len(messages))
+        
+        # Call Claude Vision API
+        async with self._sem:
+            response = await self.client.messages.create(
+                model=self.model,
+                max_tokens=4096,
+                messages=messages,
+                extra_headers=_idempotency_headers()
+            )
+        
+        # Extract text from response
+        result = response.content[0].text
+        logger.info("Received vision analysis from Claude (%s chars)", len(result))
+        
+        return truncate_text(result, config.max_message_length)
+    
     def _detect_image_format(self, image_data: bytes) -> str:
         """
         Detect image format from bytes.
@@ -190,7 +501,7 @@ class ClaudeModel:
             MIME type string
             
         Raises:
-            Exception: If image format cannot be detected
+            NonRetryableError: If image format cannot be detected
         """
         # Check magic bytes for common formats
         if image_data.startswith(b'\xff\xd8\xff'):
@@ -203,7 +514,7 @@ class ClaudeModel:
             return 'image/webp'
         else:
             # Raise exception for unknown formats
-            raise Exception("Unable to detect image format. Please ensure you're uploading a valid JPEG, PNG, GIF, or WebP image.")
+            raise NonRetryableError("Unable to detect image format. Please ensure you're uploading a valid JPEG, PNG, GIF, or WebP image.")
 
 
 class GPTModel:
@@ -211,22 +522,28 @@ class GPTModel:
     
     def __init__(self):
         """Initialize GPT-4 client."""
-        self.client = openai.AsyncOpenAI(api_key=config.openai_api_key)
+        self.client = openai.AsyncOpenAI(
+            api_key=config.openai_api_key,
+            http_client=shared_http_client
+        )
         self.model = "gpt-4o-mini"
+        self._sem = _gpt_sem
         logger.info("GPT-4 model initialized")
     
     @retry_with_backoff(max_retries=3, base_delay=1.0)
     async def generate_response(
         self,
-        message: str,
-        conversation_history: Optional[List[Dict]] = None
+        messages: List[Dict],
+        no_cache: bool = False,
+        system_prompt: Optional[str] = None
     ) -> str:
         """
         Generate response from GPT-4.
         
         Args:
-            message: User message
-            conversation_history: Optional conversation history
+            messages: Conversation history followed by the current user message
+            no_cache: Skip the response cache for this call
+            system_prompt: Optional system instructions sent ahead of the history
             
         Returns:
             GPT-4's response
@@ -235,43 +552,64 @@ class GPTModel:
             Exception: If API call fails after retries
         """
         try:
-            # Build messages list
-            messages = []
-            
-            if conversation_history:
-                # Add conversation history
-                messages.extend(conversation_history)
-            
-            # Add current message
-            messages.append({
-                "role": "user",
-                "content": message
-            })
-            
-            logger.debug(f"Sending request to GPT-4 with {len(messages)} messages")
-            
-            # Call GPT-4 API
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=4096
+            if system_prompt:
+                messages = [{"role": "system", "content": system_prompt}] + messages
+            
+            if no_cache:
+                return await self._request(messages)
+            return await llm_cache.get_or_compute(
+                llm_cache.make_key(self.model, messages),
+                lambda: self._request(messages)
             )
             
-            # Extract text from response
-            result = response.choices[0].message.content
-            logger.info(f"Received response from GPT-4 ({len(result)} chars)")
-            
-            return truncate_text(result, config.max_message_length)
-            
         except openai.RateLimitError as e:
-            logger.error(f"GPT-4 rate limit exceeded: {e}")
-            raise Exception("Rate limit exceeded. Please try again later.")
+            logger.error("GPT-4 rate limit exceeded: %s", e)
+            raise Exception("Rate limit exceeded. Please try again later.") from e
         except openai.APIError as e:
-            logger.error(f"GPT-4 API error: {e}")
-            raise Exception(f"GPT-4 API error: {str(e)}")
+            logger.error("GPT-4 API error: %s", e)
+            raise Exception(f"GPT-4 API error: {str(e)}") from e
         except Exception as e:
-            logger.error(f"Unexpected error calling GPT-4: {e}")
+            logger.error("Unexpected error calling GPT-4: %s", e)
             raise
+    
+    async def _request(self, messages: List[Dict]) -> str:
+        """
+        Send a single uncached request to GPT-4.
+        
+        Args:
+            messages: Full messages list, including any system message
+            
+        Returns:
+            GPT-4's response, truncated to the Telegram message limit
+        """
+        logger.debug("Sending request to GPT-4 with %s messages", len(messages))
+        
+        # Call GPT-4 API
+        async with self._sem:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=4096,
+                extra_headers=_idempotency_headers()
+            )
+        
+        # Extract text from response
+        result = response.choices[0].message.content
+        logger.info("Received response from GPT-4 (%s chars)", len(result))
+        
+        return truncate_text(result, config.max_message_length)
+
+
+# Fixed synthesis instructions, sent ahead of the per-request content so the
+# provider's prompt-prefix cache can reuse them across requests
+_SYNTHESIS_SYSTEM = """You are a synthesis AI. Given a user question and two AI responses, \
+create a single, comprehensive answer that combines the best insights from both responses.
+
+Provide a synthesized answer that:
+1. Combines the strongest points from both responses
+2. Resolves any contradictions thoughtfully
+3. Is clear, concise, and directly addresses the user's question
+4. Does not mention that you are synthesizing responses"""
 
 
 class MultiModelOrchestrator:
@@ -283,6 +621,23 @@ class MultiModelOrchestrator:
         self.gpt = GPTModel()
         logger.info("Multi-model orchestrator initialized")
     
+    @staticmethod
+    def _build_messages(
+        message: str,
+        conversation_history: Optional[List[Dict]] = None
+    ) -> List[Dict]:
+        """
+        Build the messages list sent to a model.
+        
+        Args:
+            message: User message
+            conversation_history: Optional conversation history
+            
+        Returns:
+            Conversation history followed by the current user message
+        """
+        return list(conversation_history or []) + [{"role": "user", "content": message}]
+    
     async def query_claude(
         self,
         message: str,
@@ -298,7 +653,7 @@ class MultiModelOrchestrator:
         Returns:
             Claude's response
         """
-        return await self.claude.generate_response(message, conversation_history)
+        return await self.claude.generate_response(self._build_messages(message, conversation_history))
     
     async def query_gpt(
         self,
@@ -315,7 +670,7 @@ class MultiModelOrchestrator:
         Returns:
             GPT-4's response
         """
-        return await self.gpt.generate_response(message, conversation_history)
+        return await self.gpt.generate_response(self._build_messages(message, conversation_history))
     
     async def query_both(
         self,
@@ -332,26 +687,25 @@ class MultiModelOrchestrator:
         Returns:
             Tuple of (synthesized_response, claude_response, gpt_response)
         """
-        import asyncio
-        
-        # Query both models in parallel
+        # Query both models in parallel with one shared messages list
+        messages = self._build_messages(message, conversation_history)
         try:
             claude_response, gpt_response = await asyncio.gather(
-                self.claude.generate_response(message, conversation_history),
-                self.gpt.generate_response(message, conversation_history),
+                self.claude.generate_response(messages),
+                self.gpt.generate_response(messages),
                 return_exceptions=True
             )
             
             # Handle failures gracefully
             if isinstance(claude_response, Exception):
-                logger.error(f"Claude failed: {claude_response}")
+                logger.error("Claude failed: %s", claude_response)
                 claude_response = "⚠️ Claude temporarily unavailable"
                 if isinstance(gpt_response, Exception):
                     raise Exception("Both models failed")
                 return gpt_response, claude_response, gpt_response
             
             if isinstance(gpt_response, Exception):
-                logger.error(f"GPT-4 failed: {gpt_response}")
+                logger.error("GPT-4 failed: %s", gpt_response)
                 gpt_response = "⚠️ GPT-4 temporarily unavailable"
                 return claude_response, claude_response, gpt_response
             
@@ -365,7 +719,7 @@ class MultiModelOrchestrator:
             return synthesized, claude_response, gpt_response
             
         except Exception as e:
-            logger.error(f"Error querying both models: {e}")
+            logger.error("Error querying both models: %s", e)
             raise
     
     async def _synthesize_responses(
@@ -385,36 +739,38 @@ class MultiModelOrchestrator:
         Returns:
             Synthesized response
         """
+        # Skip the synthesis call when both models already agree. quick_ratio only
+        # bounds similarity from above (any two English texts share most letters),
+        # so it just rules agreement out cheaply; a word-level ratio confirms it
+        if difflib.SequenceMatcher(None, claude_response, gpt_response).quick_ratio() > 0.85:
+            similarity = difflib.SequenceMatcher(
+                None, claude_response.split(), gpt_response.split()
+            ).ratio()
+            if similarity > 0.85:
+                logger.info("Responses agree (similarity %.2f), skipping synthesis", similarity)
+                return claude_response if len(claude_response) >= len(gpt_response) else gpt_response
+        
         # Truncate responses for synthesis to avoid token limits
         max_synthesis_length = 2000
         claude_truncated = truncate_text(claude_response, max_synthesis_length)
         gpt_truncated = truncate_text(gpt_response, max_synthesis_length)
         
-        synthesis_prompt = f"""You are a synthesis AI. Given a user question and two AI responses, 
-create a single, comprehensive answer that combines the best insights from both responses.
-
-User Question: {original_message}
-
-Claude's Response: {claude_truncated}
+        synthesis_prompt = f"""Claude's Response: {claude_truncated}
 
 GPT-4's Response: {gpt_truncated}
 
-Provide a synthesized answer that:
-1. Combines the strongest points from both responses
-2. Resolves any contradictions thoughtfully
-3. Is clear, concise, and directly addresses the user's question
-4. Does not mention that you are synthesizing responses
+User Question: {original_message}
 
 Synthesized Answer:"""
         
         try:
             # Use GPT-4 for synthesis
             synthesized = await self.gpt.generate_response(
-                synthesis_prompt,
-                conversation_history=None  # No history for synthesis
+                self._build_messages(synthesis_prompt),  # No history for synthesis
+                system_prompt=_SYNTHESIS_SYSTEM
             )
             return synthesized
         except Exception as e:
-            logger.error(f"Synthesis failed: {e}. Falling back to Claude response.")
+            logger.error("Synthesis failed: %s. Falling back to Claude response.", e)
             # Fallback to Claude's response
             return claude_response
@@ -5,8 +5,11 @@ Handles website updates, project pipeline, email drafts, and general ops Q&A.
 
 import logging
 import asyncio
+from collections import defaultdict
+from functools import wraps
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
+    AIORateLimiter,
     Application,
     CommandHandler,
     MessageHandler,
@@ -29,75 +32,116 @@ def _is_authorized(update: Update) -> bool:
 
 
 async def _deny(update: Update):
-    logger.warning(f"Unauthorized access attempt from chat_id={update.effective_chat.id}")
+    logger.warning("Unauthorized access attempt from chat_id=%s", update.effective_chat.id)
     await update.effective_message.reply_text("Unauthorized.")
 
 
 # ─── Helpers ──────────────────────────────────────────────────────────────────
 
+# Updates are handled concurrently; these keep each chat's agent turns in order
+_chat_locks: defaultdict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+
+def _serialized_per_chat(handler):
+    """Run handler under its chat's lock so turns within one chat never interleave."""
+    @wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not _is_authorized(update):
+            return await handler(update, context)
+        async with _chat_locks[update.effective_chat.id]:
+            return await handler(update, context)
+    return wrapper
+
+
+# Where to cut an oversized reply, best first: a line break, a sentence end, a word gap
+_BREAKS = (("\n",), (". ", "! ", "? "), (" ",))
+
+
+def _iter_chunks(text: str, limit: int):
+    """Yield slices of at most limit chars, cut at the best boundary in each window."""
+    start = 0
+    while len(text) - start > limit:
+        end = start + limit
+        cut = end
+        for seps in _BREAKS:
+            idx = max(text.rfind(sep, start, end) for sep in seps)
+            if idx >= start:
+                cut = idx + len(seps[0])
+                break
+        yield text[start:cut]
+        start = cut
+    yield text[start:]
+
+
 async def send_long(update: Update, text: str, parse_mode: str = None):
     """Send a message, splitting if over Telegram's 4096-char limit."""
-    limit = 4000
-    if len(text) <= limit:
-        await update.effective_message.reply_text(text, parse_mode=parse_mode)
-        return
-    chunks = [text[i:i+limit] for i in range(0, len(text), limit)]
-    for chunk in chunks:
+    # Chunks are sent one at a time so Telegram delivers them in order
+    for chunk in _iter_chunks(text, 4000):
         await update.effective_message.reply_text(chunk, parse_mode=parse_mode)
 
 
 # ─── Commands ─────────────────────────────────────────────────────────────────
 
+_START_MESSAGE = (
+    "Stormline Management Bot\n\n"
+    "I manage your project pipeline, website, and communications.\n\n"
+    "/status — ops overview\n"
+    "/projects — bid pipeline\n"
+    "/website — website management\n"
+    "/approvals — pending approvals\n"
+    "/clear — clear conversation history\n"
+    "/help — this menu\n\n"
+    "Or just talk to me — ask anything about your business."
+)
+
+_HELP_MESSAGE = (
+    "Stormline Bot Commands\n\n"
+    "/status — quick ops overview\n"
+    "/projects [status] — list projects (filter: estimating, submitted, won, etc.)\n"
+    "/email [query] — check Gmail inbox\n"
+    "/website — read website sections\n"
+    "/approvals — review pending website/email approvals\n"
+    "/clear — reset conversation history\n\n"
+    "Examples:\n"
+    "  'Add a new bid: Rowlett Hotel, GC is Tanner, estimating, $450K'\n"
+    "  'Update the website hero text to say...'\n"
+    "  'Draft an email to the GC at...'\n"
+    "  'What's in my pipeline?'\n"
+)
+
+_STATUS_PROMPT = (
+    "Give me a quick ops status. Check three things and summarize concisely:\n"
+    "1. Project pipeline — active bids, anything submitted or estimating\n"
+    "2. Gmail inbox — any bid invites, supplier quotes, plan deliveries, or GC messages worth knowing about\n"
+    "3. Pending approvals — anything waiting on me\n"
+    "Keep it tight. Flag anything urgent."
+)
+
+_EMAIL_PROMPT = (
+    "Check my Gmail and summarize what's important. Focus on bid invites, "
+    "supplier quotes, plan deliveries, and GC communications. Skip noise."
+)
+
+_WEBSITE_PROMPT = (
+    "Read the website hero section and services section and summarize what the website currently says. "
+    "Then tell me what sections are available to update."
+)
+
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not _is_authorized(update): return await _deny(update)
-    msg = (
-        "Stormline Management Bot\n\n"
-        "I manage your project pipeline, website, and communications.\n\n"
-        "/status — ops overview\n"
-        "/projects — bid pipeline\n"
-        "/website — website management\n"
-        "/approvals — pending approvals\n"
-        "/clear — clear conversation history\n"
-        "/help — this menu\n\n"
-        "Or just talk to me — ask anything about your business."
-    )
-    await update.message.reply_text(msg)
+    await update.message.reply_text(_START_MESSAGE)
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not _is_authorized(update): return await _deny(update)
-    msg = (
-        "Stormline Bot Commands\n\n"
-        "/status — quick ops overview\n"
-        "/projects [status] — list projects (filter: estimating, submitted, won, etc.)\n"
-        "/email [query] — check Gmail inbox\n"
-        "/website — read website sections\n"
-        "/approvals — review pending website/email approvals\n"
-        "/clear — reset conversation history\n\n"
-        "Examples:\n"
-        "  'Add a new bid: Rowlett Hotel, GC is Tanner, estimating, $450K'\n"
-        "  'Update the website hero text to say...'\n"
-        "  'Draft an email to the GC at...'\n"
-        "  'What's in my pipeline?'\n"
-    )
-    await update.message.reply_text(msg)
+    await update.message.reply_text(_HELP_MESSAGE)
 
 
+@_serialized_per_chat
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not _is_authorized(update): return await _deny(update)
-    stop_typing = asyncio.Event()
-    typing_task = asyncio.create_task(_keep_typing(update.message.chat, stop_typing))
-    response = await agent.respond(
-        update.effective_user.id,
-        "Give me a quick ops status. Check three things and summarize concisely:\n"
-        "1. Project pipeline — active bids, anything submitted or estimating\n"
-        "2. Gmail inbox — any bid invites, supplier quotes, plan deliveries, or GC messages worth knowing about\n"
-        "3. Pending approvals — anything waiting on me\n"
-        "Keep it tight. Flag anything urgent."
-    )
-    stop_typing.set()
-    await typing_task
-    await send_long(update, response)
+    await _respond(update, _STATUS_PROMPT)
 
 
 async def projects_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -122,32 +166,18 @@ async def projects_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await send_long(update, "\n".join(lines))
 
 
+@_serialized_per_chat
 async def email_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not _is_authorized(update): return await _deny(update)
     query = ' '.join(context.args) if context.args else ''
-    prompt = "Check my Gmail and summarize what's important. Focus on bid invites, supplier quotes, plan deliveries, and GC communications. Skip noise."
-    if query:
-        prompt = f"Check my Gmail for: {query}. Summarize what you find."
-    stop_typing = asyncio.Event()
-    typing_task = asyncio.create_task(_keep_typing(update.message.chat, stop_typing))
-    response = await agent.respond(update.effective_user.id, prompt)
-    stop_typing.set()
-    await typing_task
-    await send_long(update, response)
+    prompt = f"Check my Gmail for: {query}. Summarize what you find." if query else _EMAIL_PROMPT
+    await _respond(update, prompt)
 
 
+@_serialized_per_chat
 async def website_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not _is_authorized(update): return await _deny(update)
-    stop_typing = asyncio.Event()
-    typing_task = asyncio.create_task(_keep_typing(update.message.chat, stop_typing))
-    response = await agent.respond(
-        update.effective_user.id,
-        "Read the website hero section and services section and summarize what the website currently says. "
-        "Then tell me what sections are available to update."
-    )
-    stop_typing.set()
-    await typing_task
-    await send_long(update, response)
+    await _respond(update, _WEBSITE_PROMPT)
 
 
 async def approvals_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -172,6 +202,7 @@ async def approvals_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(text, reply_markup=keyboard)
 
 
+@_serialized_per_chat
 async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not _is_authorized(update): return await _deny(update)
     agent.clear_history(update.effective_user.id)
@@ -213,41 +244,82 @@ async def _keep_typing(chat, stop_event: asyncio.Event):
         await asyncio.sleep(4)
 
 
+async def _respond(update: Update, prompt: str):
+    """Run one agent turn behind a typing indicator and send the reply."""
+    stop_typing = asyncio.Event()
+    typing_task = asyncio.create_task(_keep_typing(update.message.chat, stop_typing))
+    try:
+        response = await agent.respond(update.effective_user.id, prompt)
+    finally:
+        stop_typing.set()
+        await typing_task
+    await send_long(update, response)
+
+
+# Canned replies for small talk — answered without a model round trip.
+# Acknowledgements like "ok" are left out: they are how users confirm an
+# action the agent just offered, so they must reach the agent.
+_TRIVIAL_REPLIES = {
+    "hi": "Hey! What can I help with?",
+    "hey": "Hey! What can I help with?",
+    "hello": "Hey! What can I help with?",
+    "thanks": "You're welcome!",
+    "thank you": "You're welcome!",
+    "thx": "You're welcome!",
+}
+
+
+@_serialized_per_chat
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_message = update.message.text
     if not user_message:
         return
 
     if not _is_authorized(update): return await _deny(update)
-    logger.info(f"Message from chat_id={update.effective_chat.id} user={update.effective_user.username}")
+    logger.info(
+        "Message from chat_id=%s user=%s",
+        update.effective_chat.id, update.effective_user.username
+    )
 
-    stop_typing = asyncio.Event()
-    typing_task = asyncio.create_task(_keep_typing(update.message.chat, stop_typing))
+    trivial_reply = _TRIVIAL_REPLIES.get(user_message.strip().lower().rstrip("!."))
+    if trivial_reply:
+        await update.message.reply_text(trivial_reply)
+        return
 
     try:
-        response = await agent.respond(update.effective_user.id, user_message)
-        stop_typing.set()
-        await typing_task
-        await send_long(update, response)
+        await _respond(update, user_message)
     except Exception as e:
-        stop_typing.set()
-        await typing_task
-        logger.error(f"Message handler error: {e}")
+        logger.error("Message handler error: %s", e)
         await update.message.reply_text("Something went wrong. Please try again.")
 
 
 # ─── Error handler ────────────────────────────────────────────────────────────
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    logger.error(f"Update {update} caused error: {context.error}")
+    logger.error("Update %s caused error: %s", update, context.error)
     if update and update.effective_message:
         await update.effective_message.reply_text("An error occurred. Please try again.")
 
 
 # ─── Main ─────────────────────────────────────────────────────────────────────
 
+def _install_uvloop():
+    """Use uvloop's libuv-based event loop when available (not on Windows)."""
+    try:
+        import uvloop
+    except ImportError:
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info("Using uvloop event loop")
+
+
+async def _post_init(app: Application):
+    await agent.warm_up()
+
+
 def main():
     logger.info("Starting Stormline Management Bot...")
+    _install_uvloop()
 
     app = (
         Application.builder()
@@ -256,6 +328,11 @@ def main():
         .write_timeout(60)
         .connect_timeout(30)
         .pool_timeout(60)
+        # Cap in-flight updates so a flood can't spawn unbounded handler tasks
+        .concurrent_updates(256)
+        # Defaults match Telegram's 30 msg/s global and 20 msg/min per-group limits
+        .rate_limiter(AIORateLimiter(max_retries=2))
+        .post_init(_post_init)
         .build()
     )
 
@@ -272,7 +349,11 @@ def main():
     app.add_error_handler(error_handler)
 
     logger.info("Bot running.")
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    # Only subscribe to what the handlers consume; long-poll to cut idle getUpdates calls
+    app.run_polling(
+        allowed_updates=[Update.MESSAGE, Update.CALLBACK_QUERY],
+        timeout=30
+    )
 
 
 if __name__ == '__main__':
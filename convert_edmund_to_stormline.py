@@ -5,15 +5,73 @@ Extracts itemized data from Edmund PDF and formats it into Stormline Master v3 s
 """
 
 import fitz  # PyMuPDF
+import hashlib
+import logging
+import os
 import re
 import sys
 import json
-from typing import Dict, List, Tuple
-from dataclasses import dataclass, asdict
+import tempfile
+from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass, asdict, field
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:  # stdlib json is used as a fallback
+    orjson = None
 
-@dataclass
+logger = logging.getLogger(__name__)
+
+
+# Plain-text extraction without image blocks. Reading-order sorting is
+# deliberately off: the line parser relies on the PDF's native field order
+_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# Itemized sections, by the header text that opens each one
+_SECTION_NAMES = ("STORM DRAINAGE", "WATER DISTRIBUTION", "SANITARY SEWER", "FIRE LINE / FDC")
+
+# A line naming any of these closes an open section (unless it names that section)
+_SECTION_END_RE = re.compile(r'SANITARY SEWER|WATER DISTRIBUTION|FIRE LINE|COST BREAKDOWN')
+
+# Table header cells (and blanks) that precede a section's first item
+_HEADER_SET = frozenset({'Item', 'Description', 'Qty', 'Unit', ''})
+
+# One line item: number, description, qty (or "Included"), unit on four lines
+_ITEM_RE = re.compile(
+    r'^(\d+)\n(.*)\n(Included|\d[\d,]*(?:\.\d*)?|\.\d+)\n(.{1,10})$',
+    re.MULTILINE | re.IGNORECASE
+)
+
+# Extracted proposals, keyed by a hash of the source PDF's bytes
+_CACHE_DIR = Path(__file__).resolve().parent / ".cache"
+
+# Part of every cache key; bump whenever extraction or parsing output changes
+# so entries written by an older parser are never served
+_PARSER_VERSION = 2
+
+# Project header fields
+_JOB_RE = re.compile(r'Project:\s*(.+)')
+_ADDRESS_RE = re.compile(r'Address:\s*(.+)')
+_DATE_RE = re.compile(r'Date:\s*(.+)')
+_TOTAL_RE = re.compile(r'TOTAL PROPOSAL AMOUNT\s+\$([0-9,]+)')
+
+# Cost breakdown block and the categories pulled out of it
+_COST_SECTION_RE = re.compile(r'COST BREAKDOWN(.+?)TOTAL PROPOSAL:', re.DOTALL)
+_COST_PATTERNS = [
+    (re.compile(pattern, re.IGNORECASE), key)
+    for pattern, key in [
+        (r'Materials.*?\$([0-9,]+)', 'Materials'),
+        (r'Labor\s+\$([0-9,]+)', 'Labor'),
+        (r'Equipment\s+\$([0-9,]+)', 'Equipment'),
+        (r'Travel / Lodging\s+\$([0-9,]+)', 'Travel'),
+        (r'Subtotal Field Cost\s+\$([0-9,]+)', 'Subtotal Field Cost'),
+        (r'Overhead & Profit.*?\$([0-9,]+)', 'Overhead & Profit'),
+    ]
+]
+
+
+@dataclass(slots=True)
 class LineItem:
     """Represents a single line item in the proposal."""
     number: int
@@ -24,15 +82,15 @@ class LineItem:
     total: float = 0.0
 
 
-@dataclass
+@dataclass(slots=True)
 class Section:
     """Represents a section of the proposal (Storm, Water, Sewer, Fire)."""
     name: str
-    items: List[LineItem]
+    items: List[LineItem] = field(default_factory=list)
     subtotal: float = 0.0
 
 
-@dataclass
+@dataclass(slots=True)
 class Proposal:
     """Complete proposal structure."""
     job_name: str
@@ -42,37 +100,39 @@ class Proposal:
     gc_owner: str = ""
     civil_engineer: str = ""
     engineers_date: str = ""
-    storm_drain: Section = None
-    water: Section = None
-    sanitary_sewer: Section = None
-    fire_line: Section = None
+    storm_drain: Optional[Section] = None
+    water: Optional[Section] = None
+    sanitary_sewer: Optional[Section] = None
+    fire_line: Optional[Section] = None
     total_base_bid: float = 0.0
-    cost_breakdown: Dict[str, float] = None
+    cost_breakdown: Dict[str, float] = field(default_factory=dict)
 
 
-def extract_edmund_data(pdf_path: str) -> Proposal:
+def extract_edmund_data(pdf_path: str, pdf_bytes: Optional[bytes] = None) -> Proposal:
     """
     Extract data from Edmund PDF format.
     
     Args:
         pdf_path: Path to the Edmund PDF file
+        pdf_bytes: Contents of pdf_path if already read; parsed in memory
         
     Returns:
         Proposal object with extracted data
     """
-    pdf = fitz.open(pdf_path)
+    if pdf_bytes is not None:
+        pdf = fitz.open(stream=pdf_bytes, filetype="pdf")
+    else:
+        pdf = fitz.open(pdf_path)
     
-    # Extract text from all pages
-    full_text = ""
-    for page in pdf:
-        full_text += page.get_text()
+    # Extract text from all pages; join once instead of re-copying per page
+    full_text = "".join([page.get_text("text", flags=_TEXT_FLAGS) for page in pdf])
     
     pdf.close()
     
     # Extract project information
-    job_match = re.search(r'Project:\s*(.+)', full_text)
-    address_match = re.search(r'Address:\s*(.+)', full_text)
-    date_match = re.search(r'Date:\s*(.+)', full_text)
+    job_match = _JOB_RE.search(full_text)
+    address_match = _ADDRESS_RE.search(full_text)
+    date_match = _DATE_RE.search(full_text)
     
     job_name = job_match.group(1).strip() if job_match else "Unknown Project"
     address = address_match.group(1).strip() if address_match else ""
@@ -85,17 +145,18 @@ def extract_edmund_data(pdf_path: str) -> Proposal:
         if len(parts) >= 2:
             city = parts[1].strip()
     
-    # Extract sections
-    storm_items = extract_section_items(full_text, "STORM DRAINAGE")
-    water_items = extract_section_items(full_text, "WATER DISTRIBUTION")
-    sewer_items = extract_section_items(full_text, "SANITARY SEWER")
-    fire_items = extract_section_items(full_text, "FIRE LINE / FDC")
+    # Extract sections in a single pass over the text
+    section_lines = split_sections(full_text)
+    storm_items = parse_section_items(section_lines.get("STORM DRAINAGE", []))
+    water_items = parse_section_items(section_lines.get("WATER DISTRIBUTION", []))
+    sewer_items = parse_section_items(section_lines.get("SANITARY SEWER", []))
+    fire_items = parse_section_items(section_lines.get("FIRE LINE / FDC", []))
     
     # Extract cost breakdown
     cost_breakdown = extract_cost_breakdown(full_text)
     
     # Calculate total
-    total_match = re.search(r'TOTAL PROPOSAL AMOUNT\s+\$([0-9,]+)', full_text)
+    total_match = _TOTAL_RE.search(full_text)
     total = float(total_match.group(1).replace(',', '')) if total_match else 0.0
     
     # Create proposal
@@ -116,6 +177,105 @@ def extract_edmund_data(pdf_path: str) -> Proposal:
     return proposal
 
 
+def load_or_extract(pdf_path: str, pdf_bytes: Optional[bytes] = None) -> Proposal:
+    """
+    Extract a proposal, reusing a cached extraction of identical PDF bytes
+    made by the current parser version.
+    
+    Args:
+        pdf_path: Path to the Edmund PDF file
+        pdf_bytes: Contents of pdf_path if already read
+        
+    Returns:
+        Proposal object with extracted data
+    """
+    if pdf_bytes is None:
+        pdf_bytes = Path(pdf_path).read_bytes()
+    
+    key = hashlib.blake2b(pdf_bytes, digest_size=16).hexdigest()
+    cache_path = _CACHE_DIR / f"v{_PARSER_VERSION}-{key}.json"
+    
+    try:
+        with open(cache_path) as f:
+            return proposal_from_dict(json.load(f))
+    except (OSError, ValueError, KeyError, TypeError):
+        pass  # Missing or unreadable entry; extract afresh
+    
+    proposal = extract_edmund_data(pdf_path, pdf_bytes)
+    
+    # Write to a temp file and rename so a concurrent or interrupted run
+    # never leaves a half-written entry behind
+    try:
+        _CACHE_DIR.mkdir(exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=_CACHE_DIR, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(asdict(proposal), f)
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError as e:
+        # A read-only install or full disk must not fail a finished extraction
+        logger.debug("Could not cache extraction at %s: %s", cache_path, e)
+    return proposal
+
+
+def proposal_from_dict(data: Dict) -> Proposal:
+    """
+    Rebuild a Proposal from its dataclasses.asdict() form.
+    
+    Args:
+        data: Dictionary produced by asdict(proposal)
+        
+    Returns:
+        Proposal object
+    """
+    for key in ('storm_drain', 'water', 'sanitary_sewer', 'fire_line'):
+        section = data.get(key)
+        if section is not None:
+            data[key] = Section(
+                section['name'],
+                [LineItem(**item) for item in section['items']],
+                section['subtotal']
+            )
+    return Proposal(**data)
+
+
+def split_sections(text: str) -> Dict[str, List[str]]:
+    """
+    Split the PDF text into the stripped lines of each itemized section.
+    
+    Args:
+        text: Full text from PDF
+        
+    Returns:
+        Dictionary mapping each section header found to its lines
+    """
+    sections: Dict[str, List[str]] = {}
+    open_sections: List[str] = []
+    
+    # In Edmund PDFs each field is on a separate line. A section is the
+    # run of lines after the first line naming it, up to the first line
+    # naming another section or the cost breakdown; later mentions (say,
+    # in notes) never reopen it. Lines repeating its own name are skipped.
+    for line in text.split('\n'):
+        for name in tuple(open_sections):
+            if name in line:
+                continue
+            if _SECTION_END_RE.search(line):
+                open_sections.remove(name)
+            else:
+                sections[name].append(line.strip())
+        
+        for name in _SECTION_NAMES:
+            if name in line and name not in sections:
+                sections[name] = []
+                open_sections.append(name)
+    
+    return sections
+
+
 def extract_section_items(text: str, section_name: str) -> List[LineItem]:
     """
     Extract line items from a specific section.
@@ -127,73 +287,40 @@ def extract_section_items(text: str, section_name: str) -> List[LineItem]:
     Returns:
         List of LineItem objects
     """
-    items = []
-    
-    # Find the section - in Edmund PDFs, each field is on a separate line
-    lines = text.split('\n')
-    
-    # Find the start of this section
-    in_section = False
-    section_lines = []
+    return parse_section_items(split_sections(text).get(section_name, []))
+
+
+def parse_section_items(section_lines: List[str]) -> List[LineItem]:
+    """
+    Parse line items from the lines of one section.
     
-    for line in lines:
-        if section_name in line:
-            in_section = True
-            continue
+    Args:
+        section_lines: Stripped lines following the section header
         
-        if in_section:
-            # Check if we hit the next section
-            next_sections = ['SANITARY SEWER', 'WATER DISTRIBUTION', 'FIRE LINE', 'COST BREAKDOWN']
-            if any(sec in line for sec in next_sections) and section_name not in line:
-                break
-            section_lines.append(line.strip())
+    Returns:
+        List of LineItem objects
+    """
+    items = []
     
     if not section_lines:
         return items
     
     # Skip header lines (Item, Description, Qty, Unit)
-    i = 0
-    while i < len(section_lines) and section_lines[i] in ['Item', 'Description', 'Qty', 'Unit', '']:
-        i += 1
-    
-    # Parse items in groups of 4 lines: number, description, qty, unit
-    while i < len(section_lines):
-        # Skip empty lines
-        if not section_lines[i]:
-            i += 1
-            continue
-        
-        # Try to parse as item number
-        if i + 3 < len(section_lines):
-            try:
-                item_num_str = section_lines[i]
-                description = section_lines[i + 1]
-                qty_str = section_lines[i + 2]
-                unit = section_lines[i + 3]
-                
-                # Validate and parse
-                if item_num_str.isdigit() and unit and len(unit) <= 10:
-                    item_num = int(item_num_str)
-                    
-                    # Parse quantity - could be "Included" or a number
-                    if qty_str.lower() == 'included':
-                        qty = 1.0
-                    else:
-                        qty = float(qty_str.replace(',', ''))
-                    
-                    items.append(LineItem(
-                        number=item_num,
-                        description=description,
-                        qty=qty,
-                        unit=unit
-                    ))
-                    
-                    i += 4
-                    continue
-            except (ValueError, IndexError):
-                pass
-        
-        i += 1
+    start = 0
+    while start < len(section_lines) and section_lines[start] in _HEADER_SET:
+        start += 1
+    
+    # Match every number/description/qty/unit group in one regex sweep
+    section_text = "\n".join(section_lines[start:])
+    for item_num, description, qty_str, unit in _ITEM_RE.findall(section_text):
+        # Quantity is either "Included" or a number
+        qty = 1.0 if qty_str.lower() == 'included' else float(qty_str.replace(',', ''))
+        items.append(LineItem(
+            number=int(item_num),
+            description=description,
+            qty=qty,
+            unit=unit
+        ))
     
     return items
 
@@ -211,30 +338,25 @@ def extract_cost_breakdown(text: str) -> Dict[str, float]:
     breakdown = {}
     
     # Find cost breakdown section
-    section_match = re.search(r'COST BREAKDOWN(.+?)TOTAL PROPOSAL:', text, re.DOTALL)
+    section_match = _COST_SECTION_RE.search(text)
     if not section_match:
         return breakdown
     
     section_text = section_match.group(1)
     
     # Extract cost items
-    patterns = [
-        (r'Materials.*?\$([0-9,]+)', 'Materials'),
-        (r'Labor\s+\$([0-9,]+)', 'Labor'),
-        (r'Equipment\s+\$([0-9,]+)', 'Equipment'),
-        (r'Travel / Lodging\s+\$([0-9,]+)', 'Travel'),
-        (r'Subtotal Field Cost\s+\$([0-9,]+)', 'Subtotal Field Cost'),
-        (r'Overhead & Profit.*?\$([0-9,]+)', 'Overhead & Profit'),
-    ]
-    
-    for pattern, key in patterns:
-        match = re.search(pattern, section_text, re.IGNORECASE)
+    for pattern, key in _COST_PATTERNS:
+        match = pattern.search(section_text)
         if match:
             breakdown[key] = float(match.group(1).replace(',', ''))
     
     return breakdown
 
 
+# Bound once so the item loop skips re-parsing the format spec per row
+_ROW_FMT = "{:<5} {:<45} {:<8} {:<10.2f}".format
+
+
 def format_stormline_output(proposal: Proposal) -> str:
     """
     Format proposal data into Stormline Master v3 text format.
@@ -285,9 +407,7 @@ def format_stormline_output(proposal: Proposal) -> str:
             
             section_total = 0.0
             for item in section.items:
-                output.append(
-                    f"{item.number:<5} {item.description:<45} {item.unit:<8} {item.qty:<10.2f}"
-                )
+                output.append(_ROW_FMT(item.number, item.description, item.unit, item.qty))
                 section_total += item.total
             
             output.append("-" * 80)
@@ -360,8 +480,11 @@ def save_as_json(proposal: Proposal, output_path: str):
             }
     
     # Write JSON
-    with open(output_path, 'w') as f:
-        json.dump(data, f, indent=2)
+    if orjson is not None:
+        Path(output_path).write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
 
 
 def main():
@@ -371,8 +494,10 @@ def main():
     output_txt = "edmund_converted_to_stormline_v3.txt"
     output_json = "edmund_converted_to_stormline_v3.json"
     
-    # Check if input exists
-    if not Path(input_pdf).exists():
+    # Read the input once; the same bytes are hashed for the cache and parsed
+    try:
+        pdf_bytes = Path(input_pdf).read_bytes()
+    except FileNotFoundError:
         print(f"Error: Input file '{input_pdf}' not found!")
         sys.exit(1)
     
@@ -382,7 +507,7 @@ def main():
     try:
         # Extract data
         print("\nExtracting data from Edmund PDF...")
-        proposal = extract_edmund_data(input_pdf)
+        proposal = load_or_extract(input_pdf, pdf_bytes)
         
         # Display summary
         print(f"\nExtracted Proposal Data:")
@@ -214,6 +214,68 @@ def _save_calibrations(data: dict):
         json.dump(data, f, indent=2)
 
 
+_CALIBRATE_PROMPT = """This is a screenshot of a construction plan page in PlanSwift software (page: "{page_name}").
+
+Your job is to find the graphic scale bar on this plan sheet and calibrate it.
+
+Please analyze the image and return a JSON object with these exact fields:
+{{
+  "found_scale_bar": true/false,
+  "scale_bar_length_feet": <the labeled length in feet, e.g. 50 or 100>,
+  "scale_bar_pixel_length": <estimated length of that bar in pixels>,
+  "scale_bar_location": "<describe where it is, e.g. 'bottom left corner'>",
+  "pixels_per_foot": <scale_bar_pixel_length / scale_bar_length_feet>,
+  "image_width_px": {width},
+  "image_height_px": {height},
+  "view_type": "<'plan' or 'profile' or 'detail' or 'other'>",
+  "sheet_title": "<sheet title or number if visible>",
+  "confidence": "<high/medium/low>",
+  "notes": "<anything that might affect accuracy>"
+}}
+
+Return ONLY the JSON object, no other text."""
+
+_PIPES_PROMPT = """This is a construction plan sheet (page: "{page_name}") shown in PlanSwift software.
+{cal_info}
+Image size: {width} x {height} pixels.
+
+You are a professional underground utility takeoff estimator. Analyze this plan and identify ALL pipe runs and structures visible.
+
+Return ONLY a JSON object in this exact format — no markdown, no explanation:
+{{
+  "view_type": "plan",
+  "sheet_title": "<title if visible>",
+  "pipes": [
+    {{
+      "id": "pipe_001",
+      "type": "storm|sanitary|water|fire|FDC",
+      "size": "18",
+      "material": "RCP|PVC SDR26|C900|DI|HDPE",
+      "from_structure": "<start>",
+      "to_structure": "<end>",
+      "estimated_lf": <number>,
+      "size_label_text": "<label if visible>",
+      "confidence": "high|medium|low",
+      "notes": "<slope, invert, special conditions>"
+    }}
+  ],
+  "structures": [
+    {{
+      "id": "str_001",
+      "type": "manhole|inlet|junction_box|headwall|cleanout|hydrant|valve",
+      "label": "<label if shown>",
+      "count": 1,
+      "confidence": "high|medium|low"
+    }}
+  ],
+  "flags": ["<anything uncertain or needs field verification>"]
+}}
+
+Group identical pipe sizes/types into single entries with total estimated_lf.
+For estimated_lf: visually estimate pipe length using the scale bar, or use {pixels_per_foot:.2f} px/ft calibration.
+Return ONLY the JSON object."""
+
+
 def _ps_vision_analyze(image_path: str, prompt: str) -> str:
     """Send a screenshot to Claude Vision and return the text response."""
     import anthropic, base64
@@ -248,26 +310,11 @@ def ps_calibrate_page(**_) -> dict:
     page_info = ps_get_current_page()
     page_name = page_info.get("data", {}).get("page_name", "unknown") if page_info["success"] else "unknown"
 
-    prompt = f"""This is a screenshot of a construction plan page in PlanSwift software (page: "{page_name}").
-
-Your job is to find the graphic scale bar on this plan sheet and calibrate it.
-
-Please analyze the image and return a JSON object with these exact fields:
-{{
-  "found_scale_bar": true/false,
-  "scale_bar_length_feet": <the labeled length in feet, e.g. 50 or 100>,
-  "scale_bar_pixel_length": <estimated length of that bar in pixels>,
-  "scale_bar_location": "<describe where it is, e.g. 'bottom left corner'>",
-  "pixels_per_foot": <scale_bar_pixel_length / scale_bar_length_feet>,
-  "image_width_px": {shot['width']},
-  "image_height_px": {shot['height']},
-  "view_type": "<'plan' or 'profile' or 'detail' or 'other'>",
-  "sheet_title": "<sheet title or number if visible>",
-  "confidence": "<high/medium/low>",
-  "notes": "<anything that might affect accuracy>"
-}}
-
-Return ONLY the JSON object, no other text."""
+    prompt = _CALIBRATE_PROMPT.format(
+        page_name=page_name,
+        width=shot['width'],
+        height=shot['height'],
+    )
 
     try:
         raw = _ps_vision_analyze(shot["wsl_path"], prompt)
@@ -344,45 +391,13 @@ def ps_analyze_pipes(**_) -> dict:
     cal = calibrations.get(page_name)
     cal_info = f"Calibration: {cal['pixels_per_foot']:.2f} px/ft ({cal['scale_bar_feet']} ft scale bar)" if cal else "No calibration stored for this page — lengths will be estimated only."
 
-    prompt = f"""This is a construction plan sheet (page: "{page_name}") shown in PlanSwift software.
-{cal_info}
-Image size: {shot['width']} x {shot['height']} pixels.
-
-You are a professional underground utility takeoff estimator. Analyze this plan and identify ALL pipe runs and structures visible.
-
-Return ONLY a JSON object in this exact format — no markdown, no explanation:
-{{
-  "view_type": "plan",
-  "sheet_title": "<title if visible>",
-  "pipes": [
-    {{
-      "id": "pipe_001",
-      "type": "storm|sanitary|water|fire|FDC",
-      "size": "18",
-      "material": "RCP|PVC SDR26|C900|DI|HDPE",
-      "from_structure": "<start>",
-      "to_structure": "<end>",
-      "estimated_lf": <number>,
-      "size_label_text": "<label if visible>",
-      "confidence": "high|medium|low",
-      "notes": "<slope, invert, special conditions>"
-    }}
-  ],
-  "structures": [
-    {{
-      "id": "str_001",
-      "type": "manhole|inlet|junction_box|headwall|cleanout|hydrant|valve",
-      "label": "<label if shown>",
-      "count": 1,
-      "confidence": "high|medium|low"
-    }}
-  ],
-  "flags": ["<anything uncertain or needs field verification>"]
-}}
-
-Group identical pipe sizes/types into single entries with total estimated_lf.
-For estimated_lf: visually estimate pipe length using the scale bar, or use {cal.get('pixels_per_foot', 1.56):.2f} px/ft calibration.
-Return ONLY the JSON object."""
+    prompt = _PIPES_PROMPT.format(
+        page_name=page_name,
+        cal_info=cal_info,
+        width=shot['width'],
+        height=shot['height'],
+        pixels_per_foot=(cal or {}).get('pixels_per_foot', 1.56),
+    )
 
     try:
         raw = _ps_vision_analyze(shot["wsl_path"], prompt)
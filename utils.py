@@ -5,12 +5,38 @@ Provides helper functions for logging, error handling, and message formatting.
 
 import logging
 import asyncio
-import io
-from typing import Optional, Callable, Any, List
-from functools import wraps
+import random
+import uuid
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional, Callable, Any, Dict, List, Sequence, Literal
+from functools import lru_cache, wraps
 
 logger = logging.getLogger(__name__)
 
+# Deletes C0 control characters other than tab/newline/carriage return, plus DEL
+_CTRL_TABLE = dict.fromkeys(
+    [c for c in range(0x20) if c not in (0x09, 0x0a, 0x0d)] + [0x7f]
+)
+
+# Client errors worth retrying; any other 4xx will fail again identically
+_RETRYABLE_4XX = frozenset({408, 409, 429})
+
+# Layout for format_synthesized_response, filled in one %-format pass
+_SYNTH_TEMPLATE = (
+    "🤖 **Synthesized Answer:**\n%s\n\n"
+    "---\n"
+    "💡 **Claude's perspective:**\n%s\n\n"
+    "🧠 **GPT-4's perspective:**\n%s"
+)
+
+# Returned by format_error_message whenever details are hidden from the user
+_FRIENDLY_ERROR = "⚠️ I encountered an issue processing your request. Please try again later."
+
+# Shared by every attempt of one logical call made through retry_with_backoff
+_idempotency_key: ContextVar[Optional[str]] = ContextVar('idempotency_key', default=None)
+
 
 def sanitize_input(text: str, max_length: int = 4000) -> str:
     """
@@ -26,13 +52,12 @@ def sanitize_input(text: str, max_length: int = 4000) -> str:
     if not text:
         return ""
     
-    # Strip whitespace and limit length
     text = text.strip()[:max_length]
     
-    # Basic sanitization - remove null bytes
-    text = text.replace('\x00', '')
-    
-    return text
+    # Most messages contain no control characters at all
+    if text.isprintable():
+        return text
+    return text.translate(_CTRL_TABLE)
 
 
 def format_synthesized_response(synthesized: str, claude_resp: str, gpt_resp: str) -> str:
@@ -47,12 +72,7 @@ def format_synthesized_response(synthesized: str, claude_resp: str, gpt_resp: st
     Returns:
         Formatted response string
     """
-    response = f"🤖 **Synthesized Answer:**\n{synthesized}\n\n"
-    response += "---\n"
-    response += f"💡 **Claude's perspective:**\n{claude_resp}\n\n"
-    response += f"🧠 **GPT-4's perspective:**\n{gpt_resp}"
-    
-    return response
+    return _SYNTH_TEMPLATE % (synthesized, claude_resp, gpt_resp)
 
 
 def format_error_message(error: Exception, user_friendly: bool = True) -> str:
@@ -66,44 +86,105 @@ def format_error_message(error: Exception, user_friendly: bool = True) -> str:
     Returns:
         Formatted error message
     """
-    if user_friendly:
-        return "⚠️ I encountered an issue processing your request. Please try again later."
-    else:
-        return f"Error: {str(error)}"
+    return _FRIENDLY_ERROR if user_friendly else f"Error: {error}"
+
+
+class NonRetryableError(Exception):
+    """Raised for failures that will recur identically, such as rejected input."""
+
+
+def current_idempotency_key() -> Optional[str]:
+    """
+    Get the idempotency key for the call currently being retried.
+    
+    Returns:
+        UUID string shared across retry attempts, or None outside a retried call
+    """
+    return _idempotency_key.get()
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """
+    Read the server's suggested wait from a provider error's response headers.
+    
+    Args:
+        error: Provider SDK exception
+        
+    Returns:
+        Seconds to wait, or None if the server gave no hint
+    """
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+        # The request-quota reset only matters when that quota is what ran out
+        if (
+            getattr(error, 'status_code', None) == 429
+            and headers.get('anthropic-ratelimit-requests-reset')
+        ):
+            reset = datetime.fromisoformat(headers['anthropic-ratelimit-requests-reset'])
+            return max(0.0, (reset - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        pass
+    return None
 
 
-def retry_with_backoff(max_retries: int = 3, base_delay: float = 1.0):
+def retry_with_backoff(max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 30.0):
     """
     Decorator for retrying async functions with exponential backoff.
     
+    Provider errors (raised directly or chained as __cause__) are inspected:
+    client errors other than timeouts, conflicts and rate limits fail
+    immediately, and Retry-After style headers set a floor on the delay,
+    itself capped at max_delay. NonRetryableError is never retried.
+    
     Args:
         max_retries: Maximum number of retry attempts
         base_delay: Base delay in seconds for exponential backoff
+        max_delay: Upper bound in seconds on any single wait
     """
+    # Jitter window before each retry, doubling per attempt up to max_delay
+    windows = tuple(min(base_delay * (1 << i), max_delay) for i in range(max_retries - 1))
+    
     def decorator(func: Callable) -> Callable:
         @wraps(func)
         async def wrapper(*args, **kwargs) -> Any:
-            last_exception = None
+            token = _idempotency_key.set(str(uuid.uuid4()))
             
-            for attempt in range(max_retries):
-                try:
-                    return await func(*args, **kwargs)
-                except Exception as e:
-                    last_exception = e
-                    if attempt < max_retries - 1:
-                        delay = base_delay * (2 ** attempt)
+            try:
+                for attempt in range(max_retries):
+                    try:
+                        return await func(*args, **kwargs)
+                    except NonRetryableError:
+                        raise
+                    except Exception as e:
+                        error = e.__cause__ or e
+                        status = getattr(error, 'status_code', None)
+                        if status is not None and 400 <= status < 500 and status not in _RETRYABLE_4XX:
+                            raise
+                        
+                        if attempt == max_retries - 1:
+                            logger.error(
+                                "All %d attempts failed for %s: %s", max_retries, func.__name__, e
+                            )
+                            raise
+                        
+                        # Full jitter spreads concurrent callers across the whole window
+                        # so they don't retry in lockstep; Retry-After still wins
+                        delay = random.uniform(0, windows[attempt])
+                        delay = max(delay, min(_retry_after(error) or 0.0, max_delay))
                         logger.warning(
-                            f"Attempt {attempt + 1} failed for {func.__name__}: {str(e)}. "
-                            f"Retrying in {delay}s..."
+                            "Attempt %d failed for %s: %s. Retrying in %.2fs...",
+                            attempt + 1, func.__name__, e, delay
                         )
                         await asyncio.sleep(delay)
-                    else:
-                        logger.error(
-                            f"All {max_retries} attempts failed for {func.__name__}: {str(e)}"
-                        )
-            
-            if last_exception:
-                raise last_exception
+            finally:
+                _idempotency_key.reset(token)
         
         return wrapper
     return decorator
@@ -119,8 +200,11 @@ class ConversationHistory:
         Args:
             max_length: Maximum number of messages to keep per user
         """
-        self.histories = {}
         self.max_length = max_length
+        # Bounded deques evict the oldest message in O(1) on append
+        self.histories: dict[int, deque] = defaultdict(
+            lambda: deque(maxlen=self.max_length * 2)  # *2 for user+assistant pairs
+        )
     
     def add_message(self, user_id: int, role: str, content: str):
         """
@@ -131,29 +215,26 @@ class ConversationHistory:
             role: Message role ('user' or 'assistant')
             content: Message content
         """
-        if user_id not in self.histories:
-            self.histories[user_id] = []
-        
         self.histories[user_id].append({
             'role': role,
             'content': content
         })
-        
-        # Trim history if it exceeds max length
-        if len(self.histories[user_id]) > self.max_length * 2:  # *2 for user+assistant pairs
-            self.histories[user_id] = self.histories[user_id][-self.max_length * 2:]
     
-    def get_history(self, user_id: int) -> list:
+    def get_history(self, user_id: int) -> Sequence[Dict[str, str]]:
         """
         Get conversation history for a user.
         
+        The live history is returned without copying, so callers must treat
+        it as read-only and must not hold it across an await that could
+        record a new turn; snapshot it with list() if either is needed.
+        
         Args:
             user_id: Telegram user ID
             
         Returns:
-            List of message dictionaries
+            Message dictionaries, oldest first
         """
-        return self.histories.get(user_id, [])
+        return self.histories.get(user_id, ())
     
     def clear_history(self, user_id: int):
         """
@@ -162,8 +243,8 @@ class ConversationHistory:
         Args:
             user_id: Telegram user ID
         """
-        if user_id in self.histories:
-            self.histories[user_id] = []
+        # Drop the container too so idle users don't hold an empty deque
+        self.histories.pop(user_id, None)
 
 
 def truncate_text(text: str, max_length: int = 4000, suffix: str = "...") -> str:
@@ -184,13 +265,72 @@ def truncate_text(text: str, max_length: int = 4000, suffix: str = "...") -> str
     return text[:max_length - len(suffix)] + suffix
 
 
-def pdf_to_images(pdf_bytes: bytes, max_pages: int = 10) -> List[bytes]:
+@lru_cache(maxsize=32)
+def _zoom_matrix(zoom: float):
+    """
+    Get the PyMuPDF scaling matrix for a zoom factor.
+    
+    Args:
+        zoom: Scale factor applied to the page's native size
+        
+    Returns:
+        Shared fitz.Matrix; callers must not modify it
+    """
+    import fitz  # PyMuPDF
+    
+    return fitz.Matrix(zoom, zoom)
+
+
+def _render_page(page, fmt: str = 'png', dpi: int = 144, max_edge: Optional[int] = None) -> bytes:
+    """
+    Render one PDF page to image bytes.
+    
+    Args:
+        page: Open PyMuPDF page
+        fmt: Output format, 'png' or 'jpeg'
+        dpi: Target resolution; PDF pages are laid out at 72 points per inch
+        max_edge: Optional cap in pixels on the longer side of the image
+        
+    Returns:
+        Encoded image bytes
+    """
+    import fitz  # PyMuPDF
+    
+    zoom = dpi / 72
+    if max_edge:
+        # Large plan sheets would otherwise render far past what the
+        # vision model keeps, only to be downscaled again before upload
+        zoom = min(zoom, max_edge / max(page.rect.width, page.rect.height))
+    
+    # Render straight to 3-channel RGB and encode from MuPDF's buffer,
+    # so no alpha plane is allocated and no PIL copy of the pixels is made
+    pix = page.get_pixmap(matrix=_zoom_matrix(zoom), colorspace=fitz.csRGB, alpha=False)
+    if fmt == 'jpeg':
+        return pix.tobytes("jpeg", jpg_quality=85)
+    return pix.tobytes("png")
+
+
+def pdf_to_images(
+    pdf_bytes: bytes,
+    max_pages: int = 10,
+    fmt: Literal['png', 'jpeg'] = 'png',
+    dpi: int = 144,
+    max_edge: Optional[int] = None
+) -> List[bytes]:
     """
     Convert PDF pages to images.
     
+    PNG stays the default since plan sheets and proposals are mostly line
+    art, where it encodes smaller than JPEG and keeps text crisp. Pass
+    fmt='jpeg' for scanned or photographic pages.
+    
     Args:
         pdf_bytes: PDF file bytes
         max_pages: Maximum pages to convert
+        fmt: Output format, 'png' or 'jpeg'
+        dpi: Target resolution; the default 144 matches a 2x zoom
+        max_edge: Optional cap in pixels on the longer side of each image,
+            e.g. the vision model's input limit
         
     Returns:
         List of image bytes (one per page)
@@ -200,7 +340,6 @@ def pdf_to_images(pdf_bytes: bytes, max_pages: int = 10) -> List[bytes]:
     """
     try:
         import fitz  # PyMuPDF
-        from PIL import Image
         
         images = []
         
@@ -210,35 +349,21 @@ def pdf_to_images(pdf_bytes: bytes, max_pages: int = 10) -> List[bytes]:
         # Limit to max_pages
         num_pages = min(len(pdf_document), max_pages)
         
-        logger.info(f"Converting {num_pages} pages from PDF to images")
+        logger.info("Converting %d pages from PDF to images", num_pages)
         
         for page_num in range(num_pages):
-            # Get page
-            page = pdf_document[page_num]
-            
-            # Render page to image (matrix scales the image)
-            # Use 2.0 zoom for good quality
-            mat = fitz.Matrix(2.0, 2.0)
-            pix = page.get_pixmap(matrix=mat)
-            
-            # Convert to PIL Image
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            
-            # Save to bytes
-            img_bytes = io.BytesIO()
-            img.save(img_bytes, format='PNG')
-            images.append(img_bytes.getvalue())
+            images.append(_render_page(pdf_document[page_num], fmt, dpi, max_edge))
             
-            logger.debug(f"Converted page {page_num + 1}/{num_pages}")
+            logger.debug("Converted page %d/%d", page_num + 1, num_pages)
         
         pdf_document.close()
         
-        logger.info(f"Successfully converted {len(images)} PDF pages to images")
+        logger.info("Successfully converted %d PDF pages to images", len(images))
         return images
         
     except ImportError as e:
-        logger.error(f"Required library not found for PDF processing: {e}")
+        logger.error("Required library not found for PDF processing: %s", e)
         raise Exception("PDF processing libraries not available")
     except Exception as e:
-        logger.error(f"Error converting PDF to images: {e}")
+        logger.error("Error converting PDF to images: %s", e)
         raise Exception(f"Failed to process PDF: {str(e)}")